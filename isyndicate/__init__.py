@@ -1,14 +1,20 @@
 import uuid
+from bisect import bisect_right
+from itertools import accumulate
 from pathlib import Path
 from random import randint
 import feedparser
 import rssadd
 from rssadd.source_type import SourceType
-from fnum import FnumMetadata, FnumMax
+from fnum import FnumMax
 from imeta import ImageMetadata
 import sociallimits
 
 from .exceptions import SyndicateException
+from .lock import LockSettings, feed_lock
+from .snapshot import SnapshotCache
+from .transport import TransportPolicy
+from . import lazy, metrics
 
 
 __version__ = "1.0.0"
@@ -28,13 +34,67 @@ for name, platform in sociallimits.all_platforms.items():
     setattr(TagSettings, name, settings)
 
 
+class CaptionFitter:
+    def __init__(self, tags):
+        self.tags = [tag for tag in tags if ":" not in tag]
+        self.caption = " ".join(f"#{tag}" for tag in self.tags)
+        # ends[n] is the length of the caption holding the first n tags, each tag
+        # adds a "#" and all but the first a separating space
+        self.ends = [0] + [
+            end - 1 for end in accumulate(len(tag) + 2 for tag in self.tags)
+        ]
+
+    def count(self, tag_settings=None):
+        count = len(self.tags)
+        if tag_settings is None:
+            return count
+        if tag_settings.caption_limit is not None:
+            count = max(bisect_right(self.ends, tag_settings.caption_limit) - 1, 0)
+        if tag_settings.tag_limit is not None and count > 0:
+            # At least one tag is kept once it fits the caption
+            count = min(count, max(tag_settings.tag_limit, 1))
+        return count
+
+    def fit(self, tag_settings=None):
+        return self.caption[: self.ends[self.count(tag_settings)]]
+
+    def fit_all(self, platforms=None):
+        if platforms is None:
+            platforms = {
+                name: getattr(TagSettings, name) for name in sociallimits.all_platforms
+            }
+        return {name: self.fit(settings) for name, settings in platforms.items()}
+
+
+def _error(cause, message):
+    metrics.errors.inc(cause=cause)
+    return SyndicateException(message)
+
+
+def _fetch_source(source, transport):
+    if transport is None:
+        return source
+    with metrics.stage_seconds.time(stage="fetch"):
+        return transport.fetch_source(source)
+
+
 def add_image(
     image_url,
     from_source=None,
     to_source=None,
     image_dir=None,
     tag_settings=None,
+    lock_settings=None,
+    transport=None,
 ):
+    from_source = _fetch_source(from_source, transport)
+    with feed_lock(lock_settings, from_source, to_source) as locked:
+        if not locked:
+            return None
+        return _add_image(image_url, from_source, to_source, image_dir, tag_settings)
+
+
+def _add_image(image_url, from_source, to_source, image_dir, tag_settings):
     title = Path(image_url).stem
     # This should always be treated as a new item even if an image id has been reused
     guid = str(uuid.uuid4())
@@ -43,24 +103,11 @@ def add_image(
 
     tagstr = ""
     if image_dir:
-        metadata = ImageMetadata.from_image(str(Path(image_dir) / Path(image_url).name))
-        tags = (tag for tag in metadata.tags if ":" not in tag)
-        for n, tag in enumerate(tags):
-            addedtag = tagstr + ("" if n == 0 else " ")
-            addedtag += f"#{tag}"
-            if (
-                tag_settings
-                and tag_settings.caption_limit is not None
-                and len(addedtag) > tag_settings.caption_limit
-            ):
-                break
-            tagstr = addedtag
-            if (
-                tag_settings
-                and tag_settings.tag_limit is not None
-                and n + 1 >= tag_settings.tag_limit
-            ):
-                break
+        with metrics.stage_seconds.time(stage="tags"):
+            metadata = ImageMetadata.from_image(
+                str(Path(image_dir) / Path(image_url).name)
+            )
+            tagstr = CaptionFitter(metadata.tags).fit(tag_settings)
     if tagstr == "":
         tagstr = " "
 
@@ -69,7 +116,7 @@ def add_image(
     if tag_element is None:
         tag_element = "description"
     if tag_element in ("guid", "link"):
-        raise SyndicateException(f"Tags cannot be in {tag_element} element")
+        raise _error("tag_element", f"Tags cannot be in {tag_element} element")
     if tag_element == "title":
         title = tagstr
     elif tag_element == "description":
@@ -86,6 +133,21 @@ def add_image(
     if addedtag:
         tags.append(addedtag)
 
+    with metrics.stage_seconds.time(stage="write_feed"):
+        feed = _write_item(from_source, to_source, tags)
+    metrics.posts.inc(feed=metrics.feed_label(to_source))
+    return feed
+
+
+def _write_item(from_source, to_source, tags):
+    # rssadd can only write a file when it also read the feed from a file, so
+    # fetched or in-memory feeds are rendered to bytes and written here
+    if SourceType.to_source(to_source) == SourceType.FILE and (
+        from_source is None or SourceType.from_source(from_source) != SourceType.FILE
+    ):
+        feed = rssadd.add_item(from_source=from_source, tags=tags, max_items=10)
+        Path(to_source).write_bytes(feed)
+        return None
     return rssadd.add_item(
         from_source=from_source,
         to_source=to_source,
@@ -94,14 +156,21 @@ def add_image(
     )
 
 
-def _last_from_feed(feed):
+def _last_from_feed(feed, cache=None):
     if feed is None:
         return None
+    if cache is not None:
+        return cache.last_id(feed, _last_from_feed)
+    title = lazy.first_item_title(feed)
+    if title is not lazy.UNKNOWN:
+        return None if title is None else int(title)
+
     parsed_feed = feedparser.parse(feed)
     try:
         if parsed_feed.status < 200 or parsed_feed.status > 299:
-            raise SyndicateException(
-                f"HTTP status {parsed_feed.status} while requesting feed {feed}"
+            raise _error(
+                "http_status",
+                f"HTTP status {parsed_feed.status} while requesting feed {feed}",
             )
     except AttributeError:
         pass
@@ -115,30 +184,30 @@ def _last_from_feed(feed):
     return last_id
 
 
-def _image_url_from_id(base_url, image_id, image_dir, suffix):
+def _image_url_from_id(base_url, image_id, image_dir, suffix, cache=None):
     if not suffix and not image_dir:
-        raise SyndicateException("Unable to determine image suffix")
+        raise _error("missing_suffix", "Unable to determine image suffix")
     if suffix:
         return f"{base_url}{image_id}{suffix}"
 
-    metadata = FnumMetadata.from_file(image_dir)
-    try:
-        filename = next(
-            name for name in metadata.order if name.startswith(f"{image_id}.")
-        )
-    except StopIteration:
-        raise SyndicateException("Unable to determine image suffix")
+    if cache is not None:
+        filename = cache.filename(image_dir, image_id, _max_from_dir)
+    else:
+        filename = lazy.metadata_filename(image_dir, image_id)
+    if filename is None:
+        raise _error("missing_suffix", "Unable to determine image suffix")
     return f"{base_url}{filename}"
 
 
-def _find_max(max_id, image_dir):
+def _find_max(max_id, image_dir, cache=None):
     if max_id is not None:
         return max_id
     if image_dir is None:
         return None
+    if cache is not None:
+        return cache.max_id(image_dir, _max_from_dir)
     try:
-        metadata = FnumMetadata.from_file(image_dir)
-        max_id = metadata.max
+        max_id = lazy.metadata_max(image_dir)
     except FileNotFoundError:
         try:
             max_id = FnumMax.from_file(image_dir).value
@@ -147,6 +216,10 @@ def _find_max(max_id, image_dir):
     return max_id
 
 
+def _max_from_dir(image_dir):
+    return _find_max(None, image_dir)
+
+
 def add_image_seq(
     base_url,
     from_source=None,
@@ -155,25 +228,54 @@ def add_image_seq(
     suffix=None,
     max_id=None,
     tag_settings=None,
+    lock_settings=None,
+    cache=None,
+    transport=None,
+):
+    from_source = _fetch_source(from_source, transport)
+    with feed_lock(lock_settings, from_source, to_source) as locked:
+        if not locked:
+            return None
+        feed = _add_image_seq(
+            base_url,
+            from_source,
+            to_source,
+            image_dir,
+            suffix,
+            max_id,
+            tag_settings,
+            cache,
+        )
+        if cache is not None:
+            cache.save()
+        return feed
+
+
+def _add_image_seq(
+    base_url, from_source, to_source, image_dir, suffix, max_id, tag_settings, cache
 ):
-    last_id = _last_from_feed(from_source)
+    with metrics.stage_seconds.time(stage="read_feed"):
+        last_id = _last_from_feed(from_source, cache)
 
     image_id = 1 if last_id is None else last_id + 1
 
-    max_id = _find_max(max_id, image_dir)
+    with metrics.stage_seconds.time(stage="find_max"):
+        max_id = _find_max(max_id, image_dir, cache)
     if max_id is not None and image_id >= max_id:
         # Do nothing if we can
         if SourceType.to_source(to_source) == SourceType.FILE:
             return
         # Avoid adding to the feed
-        return rssadd.add_element(
-            from_source=from_source,
-            to_source=to_source,
-            max_items=10,
-        )
+        with metrics.stage_seconds.time(stage="write_feed"):
+            return rssadd.add_element(
+                from_source=from_source,
+                to_source=to_source,
+                max_items=10,
+            )
 
-    image_url = _image_url_from_id(base_url, image_id, image_dir, suffix)
-    return add_image(
+    with metrics.stage_seconds.time(stage="resolve_image"):
+        image_url = _image_url_from_id(base_url, image_id, image_dir, suffix, cache)
+    return _add_image(
         image_url,
         from_source,
         to_source,
@@ -190,12 +292,41 @@ def add_image_random(
     suffix=None,
     max_id=None,
     tag_settings=None,
+    lock_settings=None,
+    cache=None,
+    transport=None,
+):
+    from_source = _fetch_source(from_source, transport)
+    with feed_lock(lock_settings, from_source, to_source) as locked:
+        if not locked:
+            return None
+        feed = _add_image_random(
+            base_url,
+            from_source,
+            to_source,
+            image_dir,
+            suffix,
+            max_id,
+            tag_settings,
+            cache,
+        )
+        if cache is not None:
+            cache.save()
+        return feed
+
+
+def _add_image_random(
+    base_url, from_source, to_source, image_dir, suffix, max_id, tag_settings, cache
 ):
-    max_id = _find_max(max_id, image_dir)
+    with metrics.stage_seconds.time(stage="find_max"):
+        max_id = _find_max(max_id, image_dir, cache)
     if max_id is None:
-        raise SyndicateException("Unable to determine max_id for random selection")
+        raise _error(
+            "missing_max_id", "Unable to determine max_id for random selection"
+        )
 
-    last_id = _last_from_feed(from_source)
+    with metrics.stage_seconds.time(stage="read_feed"):
+        last_id = _last_from_feed(from_source, cache)
 
     image_id = randint(1, max_id)
     if image_id == last_id:
@@ -203,8 +334,9 @@ def add_image_random(
     if image_id == 0:
         image_id = max_id
 
-    image_url = _image_url_from_id(base_url, image_id, image_dir, suffix)
-    return add_image(
+    with metrics.stage_seconds.time(stage="resolve_image"):
+        image_url = _image_url_from_id(base_url, image_id, image_dir, suffix, cache)
+    return _add_image(
         image_url,
         from_source,
         to_source,
@@ -1,2 +1,10 @@
 class SyndicateException(Exception):
     pass
+
+
+class SyndicateLockException(SyndicateException):
+    pass
+
+
+class SyndicateCircuitOpenException(SyndicateException):
+    pass
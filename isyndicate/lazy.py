@@ -0,0 +1,147 @@
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlparse
+from xml.etree.ElementTree import iterparse, ParseError
+import yaml
+from rssadd.source_type import SourceType
+from fnum import FnumMetadata
+
+
+# Returned when the fast path cannot answer and a full parse is required
+UNKNOWN = object()
+
+METADATA_FILENAME = "fnum.metadata.yaml"
+MAX_FILENAME = "fnum.max.txt"
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_RSS1 = "{http://purl.org/rss/1.0/}"
+# RDF roots are left out, RSS 0.90 items live in a namespace not handled here
+_ROOT_TAGS = ("rss", f"{_ATOM}feed")
+_ITEM_TAGS = ("item", f"{_RSS1}item", f"{_ATOM}entry")
+# Namespaced extensions such as media:title are not the item title
+_TITLE_TAGS = ("title", f"{_RSS1}title", f"{_ATOM}title")
+
+
+def _open_feed(source):
+    if isinstance(source, bytes):
+        return BytesIO(source)
+    if not isinstance(source, str):
+        return None
+    if SourceType.from_source(source) != SourceType.FILE:
+        return None
+    if urlparse(source).scheme:
+        return None
+    try:
+        return open(source, "rb")
+    except OSError:
+        return None
+
+
+def first_item_title(source):
+    stream = _open_feed(source)
+    if stream is None:
+        return UNKNOWN
+
+    with stream:
+        root = None
+        depth = 0
+        item_depth = None
+        title = None
+        try:
+            for event, element in iterparse(stream, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = element.tag
+                    elif item_depth is None and element.tag in _ITEM_TAGS:
+                        item_depth = depth
+                    continue
+                depth -= 1
+                if item_depth is None:
+                    continue
+                if depth == item_depth and element.tag in _TITLE_TAGS and title is None:
+                    # Markup or empty titles are left to feedparser to interpret
+                    if len(element) or not (element.text or "").strip():
+                        return UNKNOWN
+                    title = element.text
+                elif depth == item_depth - 1:
+                    return UNKNOWN if title is None else title
+        except ParseError:
+            return UNKNOWN
+    # Only trust an empty result for feed formats recognised above
+    return None if root in _ROOT_TAGS else UNKNOWN
+
+
+def _match_order_item(item, prefix):
+    if not item:
+        return None
+    value = item[0][2:].lstrip()
+    if value[:1] in ("'", '"'):
+        value = value[1:]
+    if not value.startswith(prefix):
+        return None
+    name = yaml.safe_load("".join(item))[0]
+    if isinstance(name, str) and name.startswith(prefix):
+        return name
+    return None
+
+
+def _scan_order(lines, prefix):
+    for line in lines:
+        if line.startswith("order:"):
+            break
+    else:
+        return UNKNOWN
+    if line[len("order:") :].strip():
+        return UNKNOWN
+
+    # Entries are written by yaml.safe_dump as "- name" lines, long names may
+    # continue on indented lines
+    item = []
+    for line in lines:
+        if item and line.startswith((" ", "\t")):
+            item.append(line)
+            continue
+        filename = _match_order_item(item, prefix)
+        if filename is not None:
+            return filename
+        if line.startswith("- "):
+            item = [line]
+        elif line.strip() and not line.startswith((" ", "\t", "#")):
+            return None
+        else:
+            return UNKNOWN
+    return _match_order_item(item, prefix)
+
+
+def _scan_metadata(dirpath, scanner):
+    path = Path(dirpath) / METADATA_FILENAME
+    with path.open(encoding="utf-8") as lines:
+        try:
+            return scanner(lines)
+        except (UnicodeDecodeError, yaml.YAMLError):
+            return UNKNOWN
+
+
+def metadata_filename(dirpath, image_id):
+    prefix = f"{image_id}."
+    filename = _scan_metadata(dirpath, lambda lines: _scan_order(lines, prefix))
+    if filename is not UNKNOWN:
+        return filename
+
+    metadata = FnumMetadata.from_file(dirpath)
+    return next((name for name in metadata.order if name.startswith(prefix)), None)
+
+
+def _scan_max(lines):
+    for line in lines:
+        if line.startswith("max:"):
+            return yaml.safe_load(line[len("max:") :])
+    return UNKNOWN
+
+
+def metadata_max(dirpath):
+    max_id = _scan_metadata(dirpath, _scan_max)
+    if max_id is not UNKNOWN:
+        return max_id
+    return FnumMetadata.from_file(dirpath).max
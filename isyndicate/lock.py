@@ -0,0 +1,76 @@
+import os
+import fcntl
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from rssadd.source_type import SourceType
+
+from .exceptions import SyndicateLockException
+from . import metrics
+
+
+class LockSettings:
+    def __init__(self, timeout=None, skip_if_locked=False, poll_interval=0.05):
+        self.timeout = timeout
+        self.skip_if_locked = skip_if_locked
+        self.poll_interval = poll_interval
+
+
+def _lock_paths(sources):
+    paths = set()
+    for source in sources:
+        if not isinstance(source, str):
+            continue
+        if SourceType.from_source(source) != SourceType.FILE:
+            continue
+        if urlparse(source).scheme:
+            continue
+        paths.add(os.path.realpath(source))
+    # A stable order avoids deadlocks between workers sharing several feeds
+    return sorted(paths)
+
+
+def _acquire(path, lock_settings):
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    if lock_settings.timeout is None and not lock_settings.skip_if_locked:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    deadline = None
+    if lock_settings.timeout is not None:
+        deadline = time.monotonic() + lock_settings.timeout
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            pass
+        if lock_settings.skip_if_locked:
+            os.close(fd)
+            return None
+        if time.monotonic() >= deadline:
+            os.close(fd)
+            metrics.errors.inc(cause="lock_timeout")
+            raise SyndicateLockException(f"Timed out waiting for lock on {path}")
+        time.sleep(lock_settings.poll_interval)
+
+
+@contextmanager
+def feed_lock(lock_settings, *sources):
+    if lock_settings is None:
+        yield True
+        return
+
+    fds = []
+    try:
+        for path in _lock_paths(sources):
+            fd = _acquire(path, lock_settings)
+            if fd is None:
+                yield False
+                return
+            fds.append(fd)
+        yield True
+    finally:
+        for fd in reversed(fds):
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
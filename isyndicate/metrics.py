@@ -0,0 +1,259 @@
+import os
+import time
+import tempfile
+from math import inf
+from threading import Lock, Thread
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{{{pairs}}}"
+
+
+def _format_value(value):
+    if value == inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+        return tuple((label, labels[label]) for label in self.labels)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key in sorted(self._values):
+                lines.extend(self._render_sample(key, self._values[key]))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=_DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[n] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels):
+        with self._lock:
+            counts, total = self._values.get(
+                self._key(labels), ([0] * len(self.buckets), 0.0)
+            )
+            return counts[-1], total
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        for bound, count in zip(self.buckets, counts):
+            labels = key + (("le", _format_value(bound)),)
+            lines.append(f"{self.name}_bucket{_format_labels(labels)} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics[name] = metric
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=_DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics[name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def default_registry():
+    registry = Registry()
+    registry.counter("isyndicate_posts_total", "Items added to a feed", ("feed",))
+    registry.counter(
+        "isyndicate_errors_total", "SyndicateException raised, by cause", ("cause",)
+    )
+    registry.histogram(
+        "isyndicate_stage_seconds",
+        "Time spent in each stage of an update",
+        ("stage",),
+    )
+    registry.counter(
+        "isyndicate_cache_requests_total",
+        "Snapshot cache lookups, by kind and result",
+        ("kind", "result"),
+    )
+    return registry
+
+
+REGISTRY = default_registry()
+
+_active_registry = ContextVar("isyndicate_metrics_registry", default=REGISTRY)
+
+
+def active_registry():
+    return _active_registry.get()
+
+
+@contextmanager
+def scoped_registry(registry=None):
+    # Only the current thread or task records into the scoped registry
+    if registry is None:
+        registry = default_registry()
+    token = _active_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        _active_registry.reset(token)
+
+
+class _ActiveMetric:
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(active_registry().get(self.name), attr)
+
+
+posts = _ActiveMetric("isyndicate_posts_total")
+errors = _ActiveMetric("isyndicate_errors_total")
+stage_seconds = _ActiveMetric("isyndicate_stage_seconds")
+cache_requests = _ActiveMetric("isyndicate_cache_requests_total")
+
+
+def feed_label(to_source):
+    if isinstance(to_source, str):
+        return to_source
+    return "memory"
+
+
+def render(registry=REGISTRY):
+    return registry.render()
+
+
+def write_textfile(path, registry=REGISTRY):
+    # Written atomically so a scraping collector never sees a partial file
+    dirpath = os.path.dirname(os.path.abspath(path))
+    fd, tmppath = tempfile.mkstemp(dir=dirpath, prefix=".isyndicate-metrics-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(registry.render())
+        os.chmod(tmppath, 0o644)
+        os.replace(tmppath, path)
+    except BaseException:
+        os.unlink(tmppath)
+        raise
+
+
+def serve(port=9464, addr="127.0.0.1", registry=REGISTRY):
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), _Handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,139 @@
+import time
+import random
+from contextlib import contextmanager
+
+from . import add_image_seq, add_image_random, lazy, metrics
+
+
+STAGES = ("read_feed", "find_max", "resolve_image", "tags", "write_feed")
+
+_MODES = {
+    "seq": add_image_seq,
+    "random": add_image_random,
+}
+
+
+class SimulationReport:
+    def __init__(self, mode, ticks, feeds):
+        self.mode = mode
+        self.ticks = ticks
+        self.feeds = feeds
+        self.seconds = 0.0
+        self.posts = 0
+        self.stalls = 0
+        self.repeats = 0
+        self.immediate_repeats = 0
+        self.stage_seconds = {}
+
+    @property
+    def updates(self):
+        return self.ticks * self.feeds
+
+    @property
+    def throughput(self):
+        return self.updates / self.seconds if self.seconds else 0.0
+
+    @property
+    def stall_rate(self):
+        return self.stalls / self.updates if self.updates else 0.0
+
+    @property
+    def repeat_rate(self):
+        return self.repeats / self.posts if self.posts else 0.0
+
+    @property
+    def immediate_repeat_rate(self):
+        return self.immediate_repeats / self.posts if self.posts else 0.0
+
+    def __repr__(self):
+        lines = [
+            f"mode: {self.mode}",
+            f"ticks: {self.ticks}",
+            f"feeds: {self.feeds}",
+            f"seconds: {self.seconds:.3f}",
+            f"throughput: {self.throughput:.1f} updates/s",
+            f"posts: {self.posts}",
+            f"stall_rate: {self.stall_rate:.4f}",
+            f"repeat_rate: {self.repeat_rate:.4f}",
+            f"immediate_repeat_rate: {self.immediate_repeat_rate:.4f}",
+        ]
+        for stage, (count, total) in self.stage_seconds.items():
+            per_call = total / count * 1e6 if count else 0.0
+            lines.append(f"stage {stage}: {count} calls, {per_call:.1f} us/call")
+        return "\n".join(lines)
+
+
+def _last_id(feed):
+    title = lazy.first_item_title(feed)
+    return None if title in (None, lazy.UNKNOWN) else int(title)
+
+
+def simulate(
+    ticks,
+    feeds,
+    mode="seq",
+    max_id=100,
+    suffix=".jpg",
+    base_url="https://invalid/",
+    seed=None,
+):
+    if mode not in _MODES:
+        raise ValueError(f"Unknown simulation mode {mode}")
+    add = _MODES[mode]
+    if max_id is None or isinstance(max_id, int):
+        max_ids = [max_id] * feeds
+    else:
+        max_ids = list(max_id)
+    if len(max_ids) != feeds:
+        raise ValueError("max_id must be an int, None or hold one value per feed")
+
+    # Simulated posts must not show up in the exported metrics
+    with _seeded(seed), metrics.scoped_registry():
+        return _run(add, mode, ticks, feeds, max_ids, suffix, base_url)
+
+
+@contextmanager
+def _seeded(seed):
+    # Unseeded runs leave the global generator alone so they vary between runs
+    if seed is None:
+        yield
+        return
+    # Seeding must not change what other users of random see afterwards
+    random_state = random.getstate()
+    random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(random_state)
+
+
+def _run(add, mode, ticks, feeds, max_ids, suffix, base_url):
+    # Feeds only ever live in memory, nothing touches the disk or network
+    states = [None] * feeds
+    last_ids = [None] * feeds
+    seen = [set() for _ in range(feeds)]
+    report = SimulationReport(mode, ticks, feeds)
+
+    for _ in range(ticks):
+        for n in range(feeds):
+            last_id = last_ids[n]
+            start = time.perf_counter()
+            states[n] = add(
+                base_url, from_source=states[n], suffix=suffix, max_id=max_ids[n]
+            )
+            # Only the update itself is timed, not the harness bookkeeping
+            report.seconds += time.perf_counter() - start
+            image_id = last_ids[n] = _last_id(states[n])
+            if mode == "seq" and image_id == last_id:
+                report.stalls += 1
+                continue
+            report.posts += 1
+            if image_id in seen[n]:
+                report.repeats += 1
+            if image_id == last_id:
+                report.immediate_repeats += 1
+            seen[n].add(image_id)
+
+    for stage in STAGES:
+        report.stage_seconds[stage] = metrics.stage_seconds.get(stage=stage)
+    return report
@@ -0,0 +1,331 @@
+import os
+import mmap
+import time
+import struct
+import tempfile
+from urllib.parse import urlparse
+from rssadd.source_type import SourceType
+from fnum import FnumMetadata
+
+from .lazy import METADATA_FILENAME, MAX_FILENAME
+from . import metrics
+
+
+_MAGIC = b"ISYNSNP2"
+_HEADER = struct.Struct("<8sII")
+_PATH = struct.Struct("<H")
+# stamp, recorded at, has_last, last_id
+_FEED = struct.Struct("<qqqqBq")
+# metadata stamp, max file stamp, recorded at, has_max, max_id,
+# table offset, table count, names offset, names size
+_DIR = struct.Struct("<qqqqqqqBqQQQQ")
+# image id, name offset, name length
+_ENTRY = struct.Struct("<qII")
+
+_MISSING = (-1, -1, -1)
+
+# Filesystem timestamps can be coarser than the clock used for recording, so a
+# file modified this close to the moment it was recorded may have changed again
+# within the same timestamp tick without its stamp changing
+_RACY_NS = 2 * 10**9
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return _MISSING
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _dir_stamp(dirpath):
+    return _stamp(os.path.join(dirpath, METADATA_FILENAME)) + _stamp(
+        os.path.join(dirpath, MAX_FILENAME)
+    )
+
+
+def _is_clean(stamp, cached_stamp, recorded_ns):
+    if stamp != cached_stamp:
+        return False
+    # Stamps are (mtime_ns, size, inode) triples, missing files have mtime -1
+    mtimes = stamp[::3]
+    return all(mtime + _RACY_NS < recorded_ns for mtime in mtimes if mtime >= 0)
+
+
+def _local_path(source):
+    if not isinstance(source, str):
+        return None
+    if SourceType.from_source(source) != SourceType.FILE:
+        return None
+    if urlparse(source).scheme:
+        return None
+    return os.path.realpath(source)
+
+
+def _id_from_filename(filename):
+    head = filename.split(".", 1)[0]
+    if "." not in filename or not head.lstrip("-").isdigit():
+        return None
+    image_id = int(head)
+    if str(image_id) != head:
+        return None
+    return image_id
+
+
+def _read_metadata(dirpath):
+    metadata = FnumMetadata.from_file(dirpath)
+    table = {}
+    for filename in metadata.order or []:
+        if not isinstance(filename, str):
+            continue
+        image_id = _id_from_filename(filename)
+        if image_id is not None and image_id not in table:
+            table[image_id] = filename
+    return metadata.max, table
+
+
+class _DirEntry:
+    def __init__(self, stamp, recorded_ns, max_id, table=None, mapped=None):
+        self.stamp = stamp
+        self.recorded_ns = recorded_ns
+        self.max_id = max_id
+        self.table = table
+        # (table offset, table count, names offset, names size) in the snapshot
+        self.mapped = mapped
+
+    @classmethod
+    def from_values(cls, values):
+        recorded_ns, has_max, max_id = values[6:9]
+        return cls(
+            tuple(values[:6]),
+            recorded_ns,
+            max_id if has_max else None,
+            mapped=tuple(values[9:]),
+        )
+
+    def filename(self, snapshot, image_id):
+        if self.table is not None:
+            return self.table.get(image_id)
+        table_offset, count, names_offset, _ = self.mapped
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_id, name_offset, name_len = _ENTRY.unpack_from(
+                snapshot, table_offset + mid * _ENTRY.size
+            )
+            if entry_id == image_id:
+                start = names_offset + name_offset
+                return snapshot[start : start + name_len].decode()
+            if entry_id < image_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+
+class SnapshotCache:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._snapshot = None
+        self._feeds = {}
+        self._dirs = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        self.close()
+        self._feeds = {}
+        self._dirs = {}
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        try:
+            self._snapshot = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_index()
+        except (ValueError, struct.error, UnicodeDecodeError):
+            # An empty, truncated or foreign file is treated as no snapshot
+            self.close()
+            self._feeds = {}
+            self._dirs = {}
+
+    def _read_path(self, offset):
+        (length,) = _PATH.unpack_from(self._snapshot, offset)
+        offset += _PATH.size
+        path = self._snapshot[offset : offset + length].decode()
+        return path, offset + length
+
+    def _read_index(self):
+        magic, feed_count, dir_count = _HEADER.unpack_from(self._snapshot, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not an isyndicate snapshot")
+        offset = _HEADER.size
+        for _ in range(feed_count):
+            path, offset = self._read_path(offset)
+            values = _FEED.unpack_from(self._snapshot, offset)
+            offset += _FEED.size
+            recorded_ns, has_last, last_id = values[3:]
+            self._feeds[path] = (
+                tuple(values[:3]),
+                recorded_ns,
+                last_id if has_last else None,
+            )
+        for _ in range(dir_count):
+            path, offset = self._read_path(offset)
+            values = _DIR.unpack_from(self._snapshot, offset)
+            offset += _DIR.size
+            self._dirs[path] = _DirEntry.from_values(values)
+
+    def close(self):
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def last_id(self, feed, load):
+        path = _local_path(feed)
+        if path is None:
+            return load(feed)
+        stamp = _stamp(path)
+        cached = self._feeds.get(path)
+        if stamp != _MISSING and cached is not None and _is_clean(stamp, *cached[:2]):
+            metrics.cache_requests.inc(kind="feed", result="hit")
+            return cached[2]
+
+        metrics.cache_requests.inc(kind="feed", result="miss")
+        recorded_ns = time.time_ns()
+        last_id = load(feed)
+        # Only cache what was read if the feed did not change meanwhile
+        if stamp != _MISSING and stamp == _stamp(path):
+            self._feeds[path] = (stamp, recorded_ns, last_id)
+            self._dirty = True
+        return last_id
+
+    def _dir_entry(self, image_dir, load_max):
+        path = os.path.realpath(image_dir)
+        stamp = _dir_stamp(path)
+        entry = self._dirs.get(path)
+        if entry is not None and _is_clean(stamp, entry.stamp, entry.recorded_ns):
+            metrics.cache_requests.inc(kind="dir", result="hit")
+            return entry
+
+        metrics.cache_requests.inc(kind="dir", result="miss")
+        recorded_ns = time.time_ns()
+        # One parse of the metadata serves both the max and the table, the max
+        # file is only consulted when there is no metadata
+        if stamp[:3] == _MISSING:
+            max_id, table = load_max(image_dir), {}
+        else:
+            max_id, table = _read_metadata(image_dir)
+        entry = _DirEntry(stamp, recorded_ns, max_id, table)
+        if stamp == _dir_stamp(path):
+            self._dirs[path] = entry
+            self._dirty = True
+        return entry
+
+    def max_id(self, image_dir, load_max):
+        return self._dir_entry(image_dir, load_max).max_id
+
+    def filename(self, image_dir, image_id, load_max):
+        entry = self._dir_entry(image_dir, load_max)
+        if entry.stamp[:3] == _MISSING:
+            raise FileNotFoundError(os.path.join(image_dir, METADATA_FILENAME))
+        return entry.filename(self._snapshot, image_id)
+
+    def _serialize(self, f):
+        feeds = sorted(self._feeds.items())
+        dirs = sorted(self._dirs.items())
+        encoded = [path.encode() for path, _ in feeds + dirs]
+        index_size = (
+            _HEADER.size
+            + sum(_PATH.size + len(path) for path in encoded)
+            + len(feeds) * _FEED.size
+            + len(dirs) * _DIR.size
+        )
+
+        index = [_HEADER.pack(_MAGIC, len(feeds), len(dirs))]
+        paths = iter(encoded)
+        for _, (stamp, recorded_ns, last_id) in feeds:
+            path = next(paths)
+            index.append(_PATH.pack(len(path)) + path)
+            index.append(
+                _FEED.pack(*stamp, recorded_ns, last_id is not None, last_id or 0)
+            )
+
+        data = []
+        data_offset = index_size
+        for _, entry in dirs:
+            if entry.table is not None:
+                names = []
+                entries = []
+                names_size = 0
+                for image_id in sorted(entry.table):
+                    name = entry.table[image_id].encode()
+                    entries.append(_ENTRY.pack(image_id, names_size, len(name)))
+                    names.append(name)
+                    names_size += len(name)
+                table_bytes = b"".join(entries)
+                names_bytes = b"".join(names)
+                count = len(entries)
+            else:
+                table_offset, count, names_offset, names_size = entry.mapped
+                table_bytes = self._snapshot[
+                    table_offset : table_offset + count * _ENTRY.size
+                ]
+                names_bytes = self._snapshot[names_offset : names_offset + names_size]
+
+            path = next(paths)
+            index.append(_PATH.pack(len(path)) + path)
+            index.append(
+                _DIR.pack(
+                    *entry.stamp,
+                    entry.recorded_ns,
+                    entry.max_id is not None,
+                    entry.max_id or 0,
+                    data_offset,
+                    count,
+                    data_offset + len(table_bytes),
+                    len(names_bytes),
+                )
+            )
+            data.append(table_bytes)
+            data.append(names_bytes)
+            data_offset += len(table_bytes) + len(names_bytes)
+
+        for chunk in index + data:
+            f.write(chunk)
+
+    def save(self):
+        if not self._dirty:
+            return
+        # The snapshot is only a cache, failing to write it must not fail a post
+        # that has already been written, the next miss rebuilds it
+        try:
+            self._write()
+        except (OSError, struct.error):
+            return
+        self._dirty = False
+        self._load()
+
+    def _write(self):
+        dirpath = os.path.dirname(os.path.abspath(self.path))
+        fd, tmppath = tempfile.mkstemp(dir=dirpath, prefix=".isyndicate-snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self._serialize(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmppath, 0o644)
+            os.replace(tmppath, self.path)
+        except BaseException:
+            os.unlink(tmppath)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
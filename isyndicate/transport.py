@@ -0,0 +1,168 @@
+import time
+import random
+from threading import Lock
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from urllib.parse import urlsplit, urljoin
+
+from .exceptions import SyndicateException, SyndicateCircuitOpenException
+from . import metrics
+
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class _RetryableError(Exception):
+    def __init__(self, message, cause):
+        super().__init__(message)
+        self.cause = cause
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._lock = Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            # Half open, let a single trial request through
+            self.opened_at = self.clock()
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class TransportPolicy:
+    def __init__(
+        self,
+        connect_timeout=10.0,
+        read_timeout=30.0,
+        retries=2,
+        backoff=0.5,
+        backoff_max=10.0,
+        failure_threshold=5,
+        reset_timeout=60.0,
+        max_redirects=5,
+    ):
+        if retries < 0:
+            raise ValueError("retries must not be negative")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_redirects = max_redirects
+        self._breakers = {}
+        self._lock = Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+            return self._breakers[host]
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter keeps workers that failed together from retrying together
+        delay = min(self.backoff_max, self.backoff * 2**attempt)
+        time.sleep(random.uniform(0, delay))
+
+    def _request(self, url):
+        parts = urlsplit(url)
+        connection_class = (
+            HTTPSConnection if parts.scheme == "https" else HTTPConnection
+        )
+        connection = connection_class(
+            parts.hostname, parts.port, timeout=self.connect_timeout
+        )
+        path = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+        try:
+            connection.connect()
+            connection.sock.settimeout(self.read_timeout)
+            connection.request("GET", path, headers={"Accept-Encoding": "identity"})
+            response = connection.getresponse()
+            return response.status, response.getheader("Location"), response.read()
+        except (OSError, HTTPException) as e:
+            raise _RetryableError(
+                f"{type(e).__name__} {e} while requesting feed {url}", "transport"
+            )
+        finally:
+            connection.close()
+
+    def _request_host(self, url):
+        # The breaker belongs to the host actually contacted, so a redirect to
+        # a failing host trips that host rather than the one redirecting to it
+        breaker = self.breaker(urlsplit(url).netloc)
+        if not breaker.allow():
+            metrics.errors.inc(cause="circuit_open")
+            raise SyndicateCircuitOpenException(
+                f"Circuit open while requesting feed {url}"
+            )
+        try:
+            status, location, body = self._request(url)
+        except _RetryableError:
+            breaker.failure()
+            raise
+        if status in _RETRY_STATUSES:
+            breaker.failure()
+        else:
+            # Any other answer shows the host is up
+            breaker.success()
+        return status, location, body
+
+    def _fetch_once(self, url):
+        for _ in range(self.max_redirects + 1):
+            status, location, body = self._request_host(url)
+            if status in _REDIRECT_STATUSES and location:
+                url = urljoin(url, location)
+                continue
+            if status in _RETRY_STATUSES:
+                raise _RetryableError(
+                    f"HTTP status {status} while requesting feed {url}", "http_status"
+                )
+            if status < 200 or status > 299:
+                metrics.errors.inc(cause="http_status")
+                raise SyndicateException(
+                    f"HTTP status {status} while requesting feed {url}"
+                )
+            return body
+        metrics.errors.inc(cause="http_status")
+        raise SyndicateException(f"Too many redirects while requesting feed {url}")
+
+    def fetch(self, url):
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetch_once(url)
+            except _RetryableError as e:
+                error = e
+            if attempt < self.retries:
+                self._sleep_before_retry(attempt)
+        metrics.errors.inc(cause=error.cause)
+        raise SyndicateException(str(error))
+
+    def fetch_source(self, source):
+        if isinstance(source, str) and urlsplit(source).scheme in ("http", "https"):
+            return self.fetch(source)
+        return source
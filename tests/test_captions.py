@@ -0,0 +1,63 @@
+from random import Random
+import sociallimits
+
+from isyndicate import CaptionFitter, TagSettings
+
+
+def _reference_caption(tags, tag_settings):
+    tagstr = ""
+    tags = (tag for tag in tags if ":" not in tag)
+    for n, tag in enumerate(tags):
+        addedtag = tagstr + ("" if n == 0 else " ")
+        addedtag += f"#{tag}"
+        if (
+            tag_settings
+            and tag_settings.caption_limit is not None
+            and len(addedtag) > tag_settings.caption_limit
+        ):
+            break
+        tagstr = addedtag
+        if (
+            tag_settings
+            and tag_settings.tag_limit is not None
+            and n + 1 >= tag_settings.tag_limit
+        ):
+            break
+    return tagstr
+
+
+def test_fit_success_matches_reference():
+    rng = Random(0)
+    limits = [None, -1, 0, 1, 2, 5, 30, 100, 2200]
+    for _ in range(300):
+        tags = [
+            "x" * rng.randint(0, 20) + (":meta" if rng.random() < 0.1 else "")
+            for _ in range(rng.randint(0, 200))
+        ]
+        fitter = CaptionFitter(tags)
+        for caption_limit in limits:
+            for tag_limit in limits:
+                settings = TagSettings(caption_limit, tag_limit)
+                assert fitter.fit(settings) == _reference_caption(tags, settings)
+        assert fitter.fit() == _reference_caption(tags, None)
+
+
+def test_fit_all_success_platforms():
+    tags = [f"test{n}" for n in range(500)] + ["meta:tagged"]
+    captions = CaptionFitter(tags).fit_all()
+    assert set(captions) == set(sociallimits.all_platforms)
+    for name, caption in captions.items():
+        assert caption == _reference_caption(tags, getattr(TagSettings, name))
+
+
+def test_fit_all_success_custom():
+    fitter = CaptionFitter(["a", "bb", "ccc"])
+    captions = fitter.fit_all(
+        {"short": TagSettings(caption_limit=6), "few": TagSettings(tag_limit=1)}
+    )
+    assert captions == {"short": "#a #bb", "few": "#a"}
+
+
+def test_fit_success_empty():
+    assert CaptionFitter([]).fit(TagSettings(caption_limit=10, tag_limit=3)) == ""
+    assert CaptionFitter(["meta:tagged"]).fit() == ""
@@ -0,0 +1,139 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import pytest
+import feedparser
+from fnum import FnumMetadata
+
+from isyndicate import add_image, _last_from_feed
+from isyndicate.lazy import (
+    UNKNOWN,
+    first_item_title,
+    metadata_filename,
+    metadata_max,
+)
+
+
+def test_first_item_title_success_bytes():
+    feed = add_image("/1.jpg", from_source=add_image("/0.jpg"))
+    assert first_item_title(feed) == "1"
+
+
+def test_first_item_title_success_file():
+    tempdir = TemporaryDirectory()
+    feedpath = Path(tempdir.name) / "feed"
+    feedpath.write_bytes(add_image("/3.jpg"))
+    assert first_item_title(str(feedpath)) == "3"
+
+
+def test_first_item_title_success_stops_at_first_item():
+    feed = add_image("/2.jpg").replace(b"</rss>", b"<truncated")
+    assert first_item_title(feed) == "2"
+
+
+def test_first_item_title_success_empty():
+    feed = add_image("/1.jpg")
+    start = feed.index(b"<item>")
+    end = feed.index(b"</item>") + len(b"</item>")
+    assert first_item_title(feed[:start] + feed[end:]) is None
+
+
+def test_first_item_title_success_atom():
+    feed = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>feed</title>
+  <entry><title>7</title></entry>
+</feed>"""
+    assert first_item_title(feed) == "7"
+
+
+def test_first_item_title_success_media_rss():
+    feed = b"""<?xml version="1.0" encoding="utf-8"?>
+<rss xmlns:media="http://search.yahoo.com/mrss/" version="2.0">
+  <channel>
+    <title>feed</title>
+    <item>
+      <media:title>99</media:title>
+      <media:group><title>98</title></media:group>
+      <title>5</title>
+    </item>
+    <item><title>4</title></item>
+  </channel>
+</rss>"""
+    assert first_item_title(feed) == "5"
+    assert feedparser.parse(feed)["items"][0]["title"] == "5"
+
+
+def test_first_item_title_unknown_rss090():
+    feed = b"""<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+  xmlns="http://my.netscape.com/rdf/simple/0.9/">
+  <channel><title>feed</title><link>https://invalid/</link></channel>
+  <item><title>7</title><link>https://invalid/7.jpg</link></item>
+</rdf:RDF>"""
+    assert first_item_title(feed) is UNKNOWN
+    assert _last_from_feed(feed) == 7
+
+
+def test_first_item_title_unknown_markup_title():
+    feed = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>feed</title>
+  <entry>
+    <title type="xhtml"><div xmlns="http://www.w3.org/1999/xhtml">8</div></title>
+  </entry>
+</feed>"""
+    assert first_item_title(feed) is UNKNOWN
+    assert _last_from_feed(feed) == 8
+    empty = add_image("/1.jpg").replace(b"<title>1</title>", b"<title> </title>")
+    assert first_item_title(empty) is UNKNOWN
+
+
+def test_first_item_title_unknown():
+    assert first_item_title("https://invalid/feed") is UNKNOWN
+    assert first_item_title("/nonexistent/feed") is UNKNOWN
+    assert first_item_title(b"<rss><channel><item>") is UNKNOWN
+    assert first_item_title(b"<other><entry><title>1</title></entry></other>") is (
+        UNKNOWN
+    )
+
+
+def test_metadata_filename_success():
+    tempdir = TemporaryDirectory()
+    long_name = "3." + "a b " * 30 + ".jpg"
+    metadata = FnumMetadata({})
+    metadata.max = 5
+    metadata.order = ["1.jpg", "10.png", long_name, "4.'q.jpg", "2.png", "2.jpg"]
+    metadata.originals = {"2.gif": "5.gif"}
+    metadata.to_file(tempdir.name)
+    assert metadata_filename(tempdir.name, 1) == "1.jpg"
+    assert metadata_filename(tempdir.name, 2) == "2.png"
+    assert metadata_filename(tempdir.name, 3) == long_name
+    assert metadata_filename(tempdir.name, 4) == "4.'q.jpg"
+    assert metadata_filename(tempdir.name, 5) is None
+
+
+def test_metadata_filename_success_fallback():
+    tempdir = TemporaryDirectory()
+    (Path(tempdir.name) / "fnum.metadata.yaml").write_text(
+        "order:\n  - 1.jpg\n  - 2.png\n"
+    )
+    assert metadata_filename(tempdir.name, 2) == "2.png"
+    (Path(tempdir.name) / "fnum.metadata.yaml").write_text("{order: [1.jpg, 2.png]}\n")
+    assert metadata_filename(tempdir.name, 2) == "2.png"
+
+
+def test_metadata_filename_fail_missing():
+    tempdir = TemporaryDirectory()
+    with pytest.raises(FileNotFoundError):
+        metadata_filename(tempdir.name, 1)
+
+
+def test_metadata_max_success():
+    tempdir = TemporaryDirectory()
+    metadata = FnumMetadata({})
+    metadata.max = 5
+    metadata.to_file(tempdir.name)
+    assert metadata_max(tempdir.name) == 5
+
+    (Path(tempdir.name) / "fnum.metadata.yaml").write_text("{order: [], max: 7}\n")
+    assert metadata_max(tempdir.name) == 7
@@ -0,0 +1,87 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from threading import Thread
+import pytest
+import feedparser
+
+from isyndicate import add_image, add_image_seq, LockSettings
+from isyndicate.lock import feed_lock
+from isyndicate.exceptions import SyndicateLockException
+
+
+BASE_URL = "https://invalid/"
+
+
+def test_lock_success_concurrent_seq():
+    tempdir = TemporaryDirectory()
+    feedpath = Path(tempdir.name) / "feed"
+    feedpath.write_bytes(add_image("/1.jpg"))
+
+    def worker():
+        add_image_seq(
+            BASE_URL,
+            from_source=str(feedpath),
+            to_source=str(feedpath),
+            suffix=".jpg",
+            lock_settings=LockSettings(),
+        )
+
+    threads = [Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    items = feedparser.parse(feedpath.read_text())["items"]
+    assert [item["title"] for item in items] == [str(n) for n in range(9, 0, -1)]
+
+
+def test_lock_success_skip_if_locked():
+    tempdir = TemporaryDirectory()
+    frompath = Path(tempdir.name) / "from"
+    topath = Path(tempdir.name) / "to"
+    frompath.write_bytes(add_image("/1.jpg"))
+    with feed_lock(LockSettings(), str(topath)):
+        result = add_image_seq(
+            BASE_URL,
+            from_source=str(frompath),
+            to_source=str(topath),
+            suffix=".jpg",
+            lock_settings=LockSettings(skip_if_locked=True),
+        )
+    assert result is None
+    assert not topath.exists()
+
+
+def test_lock_success_released():
+    tempdir = TemporaryDirectory()
+    frompath = Path(tempdir.name) / "from"
+    topath = Path(tempdir.name) / "to"
+    frompath.write_bytes(add_image("/1.jpg"))
+    with feed_lock(LockSettings(), str(topath)):
+        pass
+    add_image_seq(
+        BASE_URL,
+        from_source=str(frompath),
+        to_source=str(topath),
+        suffix=".jpg",
+        lock_settings=LockSettings(timeout=0),
+    )
+    items = feedparser.parse(topath.read_text())["items"]
+    assert items[0]["title"] == "2"
+
+
+def test_lock_fail_timeout():
+    tempdir = TemporaryDirectory()
+    frompath = Path(tempdir.name) / "from"
+    topath = Path(tempdir.name) / "to"
+    frompath.write_bytes(add_image("/1.jpg"))
+    with feed_lock(LockSettings(), str(frompath)):
+        with pytest.raises(SyndicateLockException):
+            add_image(
+                "/2.jpg",
+                from_source=str(frompath),
+                to_source=str(topath),
+                lock_settings=LockSettings(timeout=0.1),
+            )
+    assert not topath.exists()
@@ -0,0 +1,102 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from threading import Thread
+from urllib.request import urlopen
+import pytest
+
+from isyndicate import add_image, add_image_seq, add_image_random, metrics
+from isyndicate.exceptions import SyndicateException
+
+
+BASE_URL = "https://invalid/"
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.REGISTRY.reset()
+    yield
+    metrics.REGISTRY.reset()
+
+
+def test_metrics_posts_and_stages():
+    tempdir = TemporaryDirectory()
+    frompath = Path(tempdir.name) / "from"
+    topath = Path(tempdir.name) / "to"
+    frompath.write_bytes(add_image("/1.jpg"))
+    metrics.REGISTRY.reset()
+    add_image_seq(
+        BASE_URL, from_source=str(frompath), to_source=str(topath), suffix=".jpg"
+    )
+    add_image_seq(BASE_URL, suffix=".jpg")
+    assert metrics.posts.get(feed=str(topath)) == 1
+    assert metrics.posts.get(feed="memory") == 1
+    for stage in ("read_feed", "find_max", "resolve_image", "write_feed"):
+        count, total = metrics.stage_seconds.get(stage=stage)
+        assert count == 2, stage
+        assert total >= 0
+
+
+def test_metrics_errors():
+    with pytest.raises(SyndicateException):
+        add_image_seq(BASE_URL)
+    with pytest.raises(SyndicateException):
+        add_image_random(BASE_URL, suffix=".jpg")
+    assert metrics.errors.get(cause="missing_suffix") == 1
+    assert metrics.errors.get(cause="missing_max_id") == 1
+
+
+def test_metrics_render():
+    add_image("/1.jpg", to_source=None)
+    text = metrics.render()
+    assert "# TYPE isyndicate_posts_total counter\n" in text
+    assert 'isyndicate_posts_total{feed="memory"} 1\n' in text
+    assert "# TYPE isyndicate_stage_seconds histogram\n" in text
+    assert 'isyndicate_stage_seconds_bucket{stage="write_feed",le="+Inf"} 1\n' in text
+    assert 'isyndicate_stage_seconds_count{stage="write_feed"} 1\n' in text
+
+
+def test_metrics_render_escapes_labels():
+    metrics.posts.inc(feed='a"b\\c\nd')
+    assert 'isyndicate_posts_total{feed="a\\"b\\\\c\\nd"} 1' in metrics.render()
+
+
+def test_metrics_fail_wrong_labels():
+    with pytest.raises(ValueError):
+        metrics.posts.inc(stage="x")
+
+
+def test_metrics_write_textfile():
+    tempdir = TemporaryDirectory()
+    path = Path(tempdir.name) / "isyndicate.prom"
+    metrics.posts.inc(feed="memory")
+    metrics.write_textfile(str(path))
+    assert path.read_text() == metrics.render()
+    assert [p.name for p in Path(tempdir.name).iterdir()] == ["isyndicate.prom"]
+
+
+def test_metrics_serve():
+    server = metrics.serve(port=0)
+    try:
+        metrics.posts.inc(feed="memory")
+        port = server.server_address[1]
+        with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert response.read().decode() == metrics.render()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_scoped_registry():
+    def record_global():
+        metrics.posts.inc(feed="memory")
+
+    with metrics.scoped_registry() as registry:
+        metrics.posts.inc(feed="memory")
+        thread = Thread(target=record_global)
+        thread.start()
+        thread.join()
+        assert metrics.active_registry() is registry
+        assert registry.get("isyndicate_posts_total").get(feed="memory") == 1
+    assert metrics.active_registry() is metrics.REGISTRY
+    assert metrics.posts.get(feed="memory") == 1
@@ -0,0 +1,77 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import os
+import random
+import pytest
+
+from isyndicate import metrics
+from isyndicate.simulate import simulate, STAGES
+
+
+def test_simulate_success_seq():
+    report = simulate(ticks=10, feeds=3, mode="seq", max_id=5)
+    # Sequential feeds post ids 1 to 4 and then stall at max_id
+    assert report.posts == 3 * 4
+    assert report.stalls == 3 * 6
+    assert report.stall_rate == pytest.approx(0.6)
+    assert report.repeats == 0
+    assert report.throughput > 0
+    assert all(report.stage_seconds[stage][1] >= 0 for stage in STAGES)
+    assert report.stage_seconds["read_feed"][0] == 30
+    assert report.stage_seconds["write_feed"][0] == 30
+    assert "stall_rate: 0.6000" in repr(report)
+
+
+def test_simulate_success_random():
+    report = simulate(ticks=50, feeds=2, mode="random", max_id=[10, 2], seed=1)
+    assert report.posts == 100
+    assert report.stalls == 0
+    assert report.immediate_repeats == 0
+    # The second feed only has two images so it repeats after both are used
+    assert report.repeats >= 48
+    assert 0 < report.repeat_rate < 1
+
+
+def test_simulate_success_unbounded_seq():
+    report = simulate(ticks=5, feeds=2, mode="seq", max_id=None)
+    assert report.posts == 10
+    assert report.stalls == 0
+
+
+def test_simulate_success_isolated():
+    metrics.REGISTRY.reset()
+    random.seed(42)
+    expected = random.random()
+    random.seed(42)
+    simulate(ticks=3, feeds=2, mode="random", max_id=5, seed=1)
+    assert random.random() == expected
+    assert metrics.posts.get(feed="memory") == 0
+    assert metrics.stage_seconds.get(stage="write_feed") == (0, 0.0)
+
+
+def test_simulate_success_unseeded_varies():
+    random.seed(0)
+    first = simulate(ticks=20, feeds=5, mode="random", max_id=50)
+    state = random.getstate()
+    second = simulate(ticks=20, feeds=5, mode="random", max_id=50)
+    # Unseeded runs keep drawing from the global generator instead of replaying
+    assert random.getstate() != state
+    assert first.repeats != second.repeats
+
+
+def test_simulate_success_no_writes():
+    tempdir = TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(tempdir.name)
+    try:
+        simulate(ticks=3, feeds=2, mode="random", max_id=5)
+    finally:
+        os.chdir(cwd)
+    assert list(Path(tempdir.name).iterdir()) == []
+
+
+def test_simulate_fail_bad_args():
+    with pytest.raises(ValueError):
+        simulate(ticks=1, feeds=1, mode="other")
+    with pytest.raises(ValueError):
+        simulate(ticks=1, feeds=2, max_id=[5])
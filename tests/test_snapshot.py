@@ -0,0 +1,201 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import os
+import time
+import pytest
+import feedparser
+from imeta import ImageMetadata
+from fnum import FnumMetadata, FnumMax
+
+from isyndicate import add_image, add_image_seq, SnapshotCache, metrics
+
+
+BASE_URL = "https://invalid/"
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.REGISTRY.reset()
+    yield
+    metrics.REGISTRY.reset()
+
+
+def _write_images(dirpath, names):
+    for name in names:
+        (Path(dirpath) / name).write_text("")
+        ImageMetadata({"$version": "1.0", "tags": []}).to_image(
+            str(Path(dirpath) / name)
+        )
+
+
+def _backdate(*paths):
+    # Entries for files modified just before they were recorded are not trusted
+    mtime_ns = time.time_ns() - 3600 * 10**9
+    for path in paths:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _cache_count(kind, result):
+    return metrics.cache_requests.get(kind=kind, result=result)
+
+
+def test_snapshot_success_seq_reuse():
+    tempdir = TemporaryDirectory()
+    feedpath = Path(tempdir.name) / "feed"
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    feedpath.write_bytes(add_image("/1.jpg"))
+    _write_images(tempdir.name, ["2.png", "3.gif"])
+    metadata = FnumMetadata({})
+    metadata.order = ["1.jpg", "2.png", "3.gif", "4.jpg"]
+    metadata.max = 4
+    metadata.to_file(tempdir.name)
+    _backdate(Path(tempdir.name) / "fnum.metadata.yaml")
+
+    for _ in range(2):
+        with SnapshotCache(str(snapshotpath)) as cache:
+            add_image_seq(
+                BASE_URL,
+                from_source=str(feedpath),
+                to_source=str(feedpath),
+                image_dir=tempdir.name,
+                cache=cache,
+            )
+    assert snapshotpath.exists()
+    assert _cache_count("dir", "miss") == 1
+    assert _cache_count("dir", "hit") == 3
+    # The feed is rewritten by every post so it is always read again
+    assert _cache_count("feed", "miss") == 2
+
+    items = feedparser.parse(feedpath.read_text())["items"]
+    assert [item["link"] for item in items] == [
+        f"{BASE_URL}3.gif",
+        f"{BASE_URL}2.png",
+        "/1.jpg",
+    ]
+
+
+def test_snapshot_success_feed_hit():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    feedpath = Path(tempdir.name) / "feed"
+    feedpath.write_bytes(add_image("/4.jpg"))
+    _backdate(feedpath)
+
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.last_id(str(feedpath), lambda feed: 4) == 4
+        cache.save()
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.last_id(str(feedpath), lambda feed: None) == 4
+    assert _cache_count("feed", "hit") == 1
+
+
+def test_snapshot_success_racily_clean():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    feedpath = Path(tempdir.name) / "feed"
+    feedpath.write_bytes(add_image("/4.jpg"))
+
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.last_id(str(feedpath), lambda feed: 4) == 4
+        cache.save()
+
+    # Same size, inode and mtime as if rewritten within one timestamp tick
+    stat = feedpath.stat()
+    feedpath.write_bytes(feedpath.read_bytes().replace(b"4.jpg", b"5.jpg"))
+    os.utime(feedpath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.last_id(str(feedpath), lambda feed: 5) == 5
+    assert _cache_count("feed", "hit") == 0
+
+
+def test_snapshot_success_lookup_mapped():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    metadata = FnumMetadata({})
+    metadata.order = [f"{n}.jpg" for n in range(1, 1001)] + ["5.png", "07.jpg"]
+    metadata.max = 1000
+    metadata.to_file(tempdir.name)
+    _backdate(Path(tempdir.name) / "fnum.metadata.yaml")
+
+    def load_max(image_dir):
+        raise AssertionError("Max should come from fnum.metadata.yaml")
+
+    # A miss takes the max from the same parse that builds the table
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.max_id(tempdir.name, load_max) == 1000
+        cache.save()
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.max_id(tempdir.name, load_max) == 1000
+        assert cache.filename(tempdir.name, 1, load_max) == "1.jpg"
+        assert cache.filename(tempdir.name, 5, load_max) == "5.jpg"
+        assert cache.filename(tempdir.name, 7, load_max) == "7.jpg"
+        assert cache.filename(tempdir.name, 1000, load_max) == "1000.jpg"
+        assert cache.filename(tempdir.name, 1001, load_max) is None
+    assert _cache_count("dir", "hit") == 6
+
+
+def test_snapshot_success_invalidated():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    maxpath = Path(tempdir.name) / "fnum.max.txt"
+    FnumMax(5).to_file(tempdir.name)
+    _backdate(maxpath)
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.max_id(tempdir.name, lambda image_dir: 5) == 5
+        cache.save()
+
+    FnumMax(10).to_file(tempdir.name)
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.max_id(tempdir.name, lambda image_dir: 10) == 10
+    assert _cache_count("dir", "miss") == 2
+
+
+def test_snapshot_success_corrupt():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    snapshotpath.write_bytes(b"not a snapshot")
+    feedpath = Path(tempdir.name) / "feed"
+    feedpath.write_bytes(add_image("/4.jpg"))
+    _backdate(feedpath)
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.last_id(str(feedpath), lambda feed: 4) == 4
+        cache.save()
+    with SnapshotCache(str(snapshotpath)) as cache:
+        assert cache.last_id(str(feedpath), lambda feed: None) == 4
+
+
+def test_snapshot_success_unwritable():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "missing" / "snapshot"
+    frompath = Path(tempdir.name) / "from"
+    topath = Path(tempdir.name) / "to"
+    frompath.write_bytes(add_image("/1.jpg"))
+    with SnapshotCache(str(snapshotpath)) as cache:
+        add_image_seq(
+            BASE_URL,
+            from_source=str(frompath),
+            to_source=str(topath),
+            suffix=".jpg",
+            cache=cache,
+        )
+    assert not snapshotpath.exists()
+    items = feedparser.parse(topath.read_text())["items"]
+    assert items[0]["title"] == "2"
+
+
+def test_snapshot_success_uncacheable_feed():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    with SnapshotCache(str(snapshotpath)) as cache:
+        feed = add_image_seq(BASE_URL, suffix=".jpg", cache=cache)
+        add_image_seq(BASE_URL, from_source=feed, suffix=".jpg", cache=cache)
+    assert not snapshotpath.exists()
+    assert _cache_count("feed", "miss") == 0
+
+
+def test_snapshot_fail_missing_metadata():
+    tempdir = TemporaryDirectory()
+    snapshotpath = Path(tempdir.name) / "snapshot"
+    with SnapshotCache(str(snapshotpath)) as cache:
+        with pytest.raises(FileNotFoundError):
+            add_image_seq(BASE_URL, image_dir=tempdir.name, cache=cache)
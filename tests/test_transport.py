@@ -0,0 +1,174 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from threading import Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import time
+import pytest
+import feedparser
+
+from isyndicate import add_image, add_image_seq, TransportPolicy
+from isyndicate.transport import CircuitBreaker
+from isyndicate.exceptions import (
+    SyndicateException,
+    SyndicateCircuitOpenException,
+)
+
+
+BASE_URL = "https://invalid/"
+
+
+class _StandIn:
+    def __init__(self, responses):
+        # Each response is (status, body, delay); the last one repeats
+        self.responses = list(responses)
+        self.requests = 0
+        standin = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                index = min(standin.requests, len(standin.responses) - 1)
+                standin.requests += 1
+                status, body, delay = standin.responses[index]
+                time.sleep(delay)
+                self.send_response(status)
+                if status in (301, 302):
+                    self.send_header("Location", body.decode())
+                    body = b""
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/feed"
+        Thread(target=self.server.serve_forever, args=(0.01,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def standin():
+    servers = []
+
+    def start(*responses):
+        server = _StandIn(responses)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _policy(**kwargs):
+    kwargs.setdefault("backoff", 0.001)
+    kwargs.setdefault("connect_timeout", 1)
+    kwargs.setdefault("read_timeout", 1)
+    return TransportPolicy(**kwargs)
+
+
+def test_transport_success_seq_from_url(standin):
+    server = standin((200, add_image("/1.jpg"), 0))
+    feed = add_image_seq(
+        BASE_URL, from_source=server.url, suffix=".jpg", transport=_policy()
+    )
+    items = feedparser.parse(feed)["items"]
+    assert [item["title"] for item in items] == ["2", "1"]
+    assert server.requests == 1
+
+
+def test_transport_success_seq_url_to_file(standin):
+    server = standin((200, add_image("/1.jpg"), 0))
+    tempdir = TemporaryDirectory()
+    topath = Path(tempdir.name) / "to"
+    add_image_seq(
+        BASE_URL,
+        from_source=server.url,
+        to_source=str(topath),
+        suffix=".jpg",
+        transport=_policy(),
+    )
+    items = feedparser.parse(topath.read_text())["items"]
+    assert [item["title"] for item in items] == ["2", "1"]
+
+
+def test_transport_success_retry(standin):
+    server = standin((503, b"", 0), (500, b"", 0), (200, b"feed", 0))
+    assert _policy(retries=2).fetch(server.url) == b"feed"
+    assert server.requests == 3
+
+
+def test_transport_success_redirect(standin):
+    target = standin((200, b"feed", 0))
+    server = standin((302, target.url.encode(), 0))
+    assert _policy().fetch(server.url) == b"feed"
+
+
+def test_transport_fail_retries_exhausted(standin):
+    server = standin((503, b"", 0))
+    with pytest.raises(SyndicateException, match="HTTP status 503"):
+        _policy(retries=2).fetch(server.url)
+    assert server.requests == 3
+
+
+def test_transport_fail_client_error_not_retried(standin):
+    server = standin((404, b"", 0))
+    with pytest.raises(SyndicateException, match="HTTP status 404"):
+        _policy(retries=2).fetch(server.url)
+    assert server.requests == 1
+
+
+def test_transport_fail_read_timeout(standin):
+    server = standin((200, b"feed", 0.5))
+    with pytest.raises(SyndicateException):
+        _policy(retries=0, read_timeout=0.1).fetch(server.url)
+
+
+def test_transport_fail_circuit_open(standin):
+    server = standin((500, b"", 0))
+    policy = _policy(retries=0, failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(SyndicateException):
+            policy.fetch(server.url)
+    with pytest.raises(SyndicateCircuitOpenException):
+        add_image_seq(BASE_URL, from_source=server.url, suffix=".jpg", transport=policy)
+    assert server.requests == 2
+
+
+def test_transport_fail_circuit_open_redirect_target(standin):
+    target = standin((500, b"", 0))
+    server = standin((302, target.url.encode(), 0))
+    policy = _policy(retries=0, failure_threshold=1)
+    with pytest.raises(SyndicateException):
+        policy.fetch(server.url)
+    with pytest.raises(SyndicateCircuitOpenException):
+        policy.fetch(target.url)
+    # The redirecting host is still healthy
+    with pytest.raises(SyndicateCircuitOpenException):
+        policy.fetch(server.url)
+    assert server.requests == 2
+    assert target.requests == 1
+
+
+def test_transport_fail_negative_retries():
+    with pytest.raises(ValueError):
+        TransportPolicy(retries=-1)
+
+
+def test_circuit_breaker_half_open():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=1, reset_timeout=10, clock=lambda: now[0]
+    )
+    breaker.failure()
+    assert not breaker.allow()
+    now[0] = 10.0
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.allow()